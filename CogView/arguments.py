@@ -256,13 +256,20 @@ def add_data_args(parser):
 
     group.add_argument('--num-workers', type=int, default=2,
                        help="""Number of workers to use for dataloading""")
+    group.add_argument('--prefetch-factor', type=int, default=4,
+                       help="""Number of batches loaded in advance by each worker""")
 
     group.add_argument('--dataset-type', type=str,
                        default='TokenizedDataset',
                        choices=['TokenizedDataset',
-                                'TextCodeDataset'],
+                                'TextCodeDataset',
+                                'FixedLengthTokenizedDataset'],
                        help='what type of dataset to use')
 
+    group.add_argument('--lmdb-batched-read', action='store_true',
+                       help='read TokenizedDataset lmdbs sequentially in whole batches '
+                       'with one cursor walk instead of random per-sample lookups, '
+                       'rows are not shuffled and t2i/i2t lmdbs are not enlarged')
     group.add_argument('--max-memory-length', type=int, default=2048,
                        help="max memory buffer for attention")
     group.add_argument('--new-dataset-path', type=str, default=None,
@@ -20,7 +20,7 @@ import torch.nn.functional as F
 from bisect import bisect_right
 
 from .unified_tokenizer import get_tokenizer
-from .datasets import get_dataset_by_type
+from .datasets import get_dataset_by_type, get_max_len, LMDBBatchedDataset
 from torch.utils import data
 from .samplers import DistributedBatchSampler
 
@@ -33,6 +33,20 @@ def make_data_loader(dataset, batch_size, num_iters, args):
     rank = torch.distributed.get_rank(group=mpu.get_data_parallel_group())
     distributed = world_size > 1
 
+    # keep workers (and their lmdb handles) alive across epochs
+    worker_kwargs = {}
+    if args.num_workers > 0:
+        worker_kwargs = {'persistent_workers': True,
+                        'prefetch_factor': args.prefetch_factor}
+
+    if isinstance(dataset, data.IterableDataset):
+        # already batched and sharded by the dataset itself
+        return torch.utils.data.DataLoader(dataset,
+                                           batch_size=None,
+                                           num_workers=args.num_workers,
+                                           pin_memory=True,
+                                           **worker_kwargs)
+
     sampler = torch.utils.data.SequentialSampler(dataset)
     drop_last = distributed
     # the GPUs in the same model parallel group receive the same data
@@ -50,7 +64,8 @@ def make_data_loader(dataset, batch_size, num_iters, args):
     data_loader = torch.utils.data.DataLoader(dataset,
                                               batch_sampler=batch_sampler,
                                               num_workers=args.num_workers,
-                                              pin_memory=True)
+                                              pin_memory=True,
+                                              **worker_kwargs)
     return data_loader
 
 
@@ -61,6 +76,8 @@ def make_dataset(dataset_type, path, split, args, **kwargs):
         split = [1.]
 
     assert isinstance(path, list)
+    if args.lmdb_batched_read:
+        return make_batched_dataset(dataset_type, path, split, args, **kwargs)
     # TODO other dsclass, e.g. odps
     # ds = [get_dataset_by_type(dataset_type, p, args) for p in path]
     # dataset object can be copied N times
@@ -83,6 +100,22 @@ def make_dataset(dataset_type, path, split, args, **kwargs):
     # FIXME this will merge valid set and train set.
     return ds
 
+def make_batched_dataset(dataset_type, path, split, args, batch_size=None):
+    """read the lmdbs sequentially in whole batches, see LMDBBatchedDataset"""
+    assert dataset_type == 'TokenizedDataset', 'batched read only supports TokenizedDataset.'
+    world_size = torch.distributed.get_world_size(
+        group=mpu.get_data_parallel_group())
+    rank = torch.distributed.get_rank(group=mpu.get_data_parallel_group())
+    pad_id = get_tokenizer()['[PAD]']
+    for p in path:
+        if p.find('t2i') >= 0 or p.find('i2t') >= 0:
+            print(f'Warning: batched read does not enlarge {p}, every lmdb is read once per pass.')
+    ds = LMDBBatchedDataset(path, batch_size or args.batch_size, get_max_len(args), pad_id, rank, world_size)
+    if should_split(split):
+        print('Warning: batched read cannot split datasets, use --valid-data instead.')
+        return ds, None, None
+    return ds
+
 def make_loaders(args):
     """makes training/val/test"""
 
@@ -103,6 +136,9 @@ def make_loaders(args):
 
     eval_set_args = copy.copy(data_set_args)
     eval_set_args['split'] = [1.]
+    if args.lmdb_batched_read:
+        # batched datasets are built with the per rank batch size.
+        eval_set_args['batch_size'] = args.eval_batch_size
     
     # make datasets splits and tokenizer
     train = None
@@ -135,7 +171,9 @@ def make_loaders(args):
     else:
         args.do_valid = False
     if test is not None:
-        test = make_data_loader(test, eval_batch_size, len(test) // eval_batch_size + 1, args)
+        # batched datasets are endless and have no len, like the training set
+        test_iters = None if isinstance(test, data.IterableDataset) else len(test) // eval_batch_size + 1
+        test = make_data_loader(test, eval_batch_size, test_iters, args)
         args.do_test = True
     else:
         args.do_test = False
@@ -20,9 +20,11 @@ import torch
 import torch.nn.functional as F
 from torchvision import datasets, transforms
 import pickle
+import struct
 from collections import namedtuple
+from functools import lru_cache
 
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 import lmdb
 
 from .unified_tokenizer import get_tokenizer
@@ -30,71 +32,260 @@ from .templates import TextCodeTemplate
 
 logger = logging.getLogger(__name__)
 
+# FixedLengthTokenizedDataset record: <seq_len: uint32> <ml tokens: int32>
+FIXED_LENGTH_HEADER = struct.Struct('<I')
+
+# serialize_row record: <dtype code: 1B> <ndim: 1B> <shape: ndim * uint32> <raw data>
+# every pickle opcode is >= len(ROW_DTYPES), so old pickled rows still load.
+ROW_DTYPES = [np.dtype(t) for t in (np.int8, np.uint8, np.int16, np.uint16, 
+    np.int32, np.uint32, np.int64, np.uint64, np.float16, np.float32, np.float64)]
+
+
+def serialize_row(row):
+    '''Pack a numpy row into a raw header + buffer record, fall back to pickle.'''
+    if not isinstance(row, np.ndarray) or row.dtype not in ROW_DTYPES:
+        return pickle.dumps(row)
+    row = np.ascontiguousarray(row)
+    header = struct.pack(f'<BB{row.ndim}I', ROW_DTYPES.index(row.dtype), row.ndim, *row.shape)
+    return header + row.tobytes()
+
+
+def deserialize_row(buf):
+    '''Inverse of serialize_row, the array is a view of buf without copying.'''
+    code = buf[0]
+    if code >= len(ROW_DTYPES):
+        return pickle.loads(buf)
+    ndim = buf[1]
+    shape = struct.unpack_from(f'<{ndim}I', buf, 2)
+    return np.frombuffer(buf, dtype=ROW_DTYPES[code], offset=2 + 4 * ndim).reshape(shape)
+
+
+def open_lmdb_env(path):
+    env = lmdb.open(
+        path,
+        max_readers=32,
+        readonly=True,
+        lock=False,
+        readahead=False,
+        meminit=False,
+    )
+    if not env:
+        raise IOError('Cannot open lmdb dataset', path)
+    return env
+
 
 class LMDBDataset(Dataset):
-    def __init__(self, path, process_fn):
-        self.env = lmdb.open(
-            path,
-            max_readers=32,
-            readonly=True,
-            lock=False,
-            readahead=False,
-            meminit=False,
-        )
+    def __init__(self, path, process_fn, decode_fn=deserialize_row):
+        self.path = path
         self.process_fn = process_fn
-        if not self.env:
-            raise IOError('Cannot open lmdb dataset', path)
+        # decode_fn=None hands the raw buffer of each value to process_fn.
+        self.decode_fn = decode_fn
+        # the env and the read txn are opened lazily in each worker, see _open.
+        self.env, self._txn, self._pid = None, None, None
 
-        with self.env.begin(write=False) as txn:
-            self.length = int(txn.get('length'.encode('utf-8')).decode('utf-8'))
+        env = open_lmdb_env(self.path)
+        with env.begin(write=False) as txn:
+            self.length = int(txn.get(b'length'))
+        env.close()
+
+    def _open(self):
+        # lmdb handles must not cross a fork, so every process opens its own
+        # env and keeps one long-lived read txn for all the following reads.
+        self.env = open_lmdb_env(self.path)
+        self._txn = self.env.begin(write=False, buffers=True)
+        self._pid = os.getpid()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['env'], state['_txn'], state['_pid'] = None, None, None
+        return state
 
     def __len__(self):
         return self.length
 
     def __getitem__(self, idx):
+        if self._txn is None or self._pid != os.getpid():
+            self._open()
+        key = str(idx).encode('utf-8')
+        # with buffers=True, get returns a memoryview into the mmap, no copy.
+        row = self._txn.get(key)
+        if self.decode_fn is not None:
+            row = self.decode_fn(row)
+        return self.process_fn(row)
+        
+
+def lexicographic_key(n, k):
+    '''The k-th (from 0) of the keys str(0), ..., str(n - 1) in lmdb (byte) order.'''
+    if k == 0:
+        return b'0'
+    # walk the digit trie of 1..n-1, skipping whole subtrees by their size.
+    cur, k = 1, k - 1
+    while k > 0:
+        first, last, steps = cur, cur, 0
+        while first < n:
+            steps += min(last, n - 1) - first + 1
+            first, last = first * 10, last * 10 + 9
+        if steps <= k:
+            cur, k = cur + 1, k - steps
+        else:
+            cur, k = cur * 10, k - 1
+    return str(cur).encode('utf-8')
 
-        with self.env.begin(write=False) as txn:
-            key = str(idx).encode('utf-8')
 
-            row = pickle.loads(txn.get(key))
+class LMDBBatchedDataset(IterableDataset):
+    '''
+    Read TokenizedDataset rows with sequential cursor walks and yield already
+    padded batches, use with DataLoader(batch_size=None).
+    The rows of all the lmdbs, each in key order, are concatenated and every
+    (rank, worker) shard gets a contiguous range of whole batches, which it
+    reads with cursor.set_range and walks again when exhausted, like the
+    endless RandomMappingDataset. There is no shuffling and no per-path
+    enlarging, rows come out in lmdb key order.
+    Like DistributedBatchSampler.start_iter, start_iter is the number of
+    batches this rank already consumed, the walk resumes after them.
+    '''
+    def __init__(self, paths, batch_size, ml, pad_id, rank=0, world_size=1):
+        self.paths = paths
+        self.batch_size = batch_size
+        self.ml = ml
+        self.pad_id = pad_id
+        self.rank = rank
+        self.world_size = world_size
+        self.start_iter = 0
 
-            return self.process_fn(row)
-        
+        self.lengths = []
+        for path in paths:
+            env = open_lmdb_env(path)
+            with env.begin(write=False) as txn:
+                self.lengths.append(int(txn.get(b'length')))
+            env.close()
 
-def get_dataset_by_type(dataset_type, path: str, args, DS_CLASS=LMDBDataset):       
+    def shard_range(self):
+        '''[start, end) rows of this (rank, worker) in the concatenated lmdbs.'''
+        worker_info = get_worker_info()
+        num_workers, worker_id = (1, 0) if worker_info is None else (worker_info.num_workers, worker_info.id)
+        num_shards = self.world_size * num_workers
+        shard = self.rank * num_workers + worker_id
+        num_batches = sum(self.lengths) // self.batch_size
+        return (num_batches * shard // num_shards * self.batch_size,
+            num_batches * (shard + 1) // num_shards * self.batch_size)
 
-    tokenizer = get_tokenizer()
+    def __iter__(self):
+        start, end = self.shard_range()
+        if start == end:
+            return
+        # The DataLoader takes batches from the workers in turn, skip the
+        # ones of this worker among the start_iter consumed batches.
+        worker_info = get_worker_info()
+        num_workers, worker_id = (1, 0) if worker_info is None else (worker_info.num_workers, worker_info.id)
+        consumed = (self.start_iter + num_workers - 1 - worker_id) // num_workers
+        first = start + consumed % ((end - start) // self.batch_size) * self.batch_size
+
+        text = np.full((self.batch_size, self.ml), self.pad_id, dtype=np.int32)
+        lens = np.empty(self.batch_size, dtype=np.int64)
+        i = 0
+        while True:
+            offset = 0
+            for path, length in zip(self.paths, self.lengths):
+                lo, hi = max(first - offset, 0), min(end - offset, length)
+                offset += length
+                if lo >= hi:
+                    continue
+                env = open_lmdb_env(path)
+                try:
+                    with env.begin(write=False, buffers=True) as txn:
+                        cursor = txn.cursor()
+                        cursor.set_range(lexicographic_key(length, lo))
+                        rows = cursor.iternext(keys=False, values=True)
+                        for _, buf in zip(range(hi - lo), rows):
+                            # rows are copied into the batch while the buffer is valid.
+                            row = deserialize_row(buf).ravel()[:self.ml]
+                            text[i, :len(row)] = row
+                            lens[i] = len(row)
+                            i += 1
+                            if i == self.batch_size:
+                                loss_mask = (np.arange(self.ml) < lens[:, None]).astype(np.uint8)
+                                yield {'text': text, 'loss_mask': loss_mask}
+                                text = np.full((self.batch_size, self.ml), self.pad_id, dtype=np.int32)
+                                i = 0
+                finally:
+                    env.close()
+            first = start
+
+
+def get_max_len(args):
     if args.finetune and args.max_position_embeddings_finetune > args.max_position_embeddings:
-        ml = args.max_position_embeddings_finetune
+        return args.max_position_embeddings_finetune
     else:
-        ml = args.max_position_embeddings
+        return args.max_position_embeddings
+
+
+def get_dataset_by_type(dataset_type, path: str, args, DS_CLASS=LMDBDataset):       
+
+    tokenizer = get_tokenizer()
+    ml = get_max_len(args)
 
+    pad_id = tokenizer['[PAD]']
+
+    # The buffers below are np.empty + two slice writes, so every element is
+    # written once instead of a full pad/zero fill followed by the copy.
     def pad_to_len(ret):
-        
-        if len(ret) < ml: # pad
-            return np.concatenate((ret, 
-                np.array([tokenizer['[PAD]']] * (ml - len(ret)))),
-                axis=0), len(ret)
+        n = len(ret)
+        if n < ml: # pad
+            out = np.empty(ml, dtype=np.int32)
+            out[:n] = ret
+            out[n:] = pad_id
+            return out, n
         else:
-            if len(ret) > ml:
+            if n > ml:
                 logger.warning('Out of max len, truncated.')
-            return ret[:ml], ml
+            # ret may be a view of the lmdb buffer, return an owned copy.
+            return np.array(ret[:ml], dtype=np.int32), ml
+
+    # Only depends on the length, so one mask per length is shared by all rows,
+    # default_collate copies it into the batch.
+    @lru_cache(maxsize=None)
+    def build_loss_mask(attention_mask_sep):
+        loss_mask = np.empty(ml, dtype=np.uint8)
+        loss_mask[:attention_mask_sep] = 1
+        loss_mask[attention_mask_sep:] = 0
+        return loss_mask
 
     if dataset_type == 'TokenizedDataset':
         # already tokenized when saved
         def process_fn(row):
-            ret, attention_mask_sep = pad_to_len(row.flatten())
+            ret, attention_mask_sep = pad_to_len(row.ravel())
             return {'text': ret, 
-                'loss_mask':  np.array([1] * attention_mask_sep + [0] * (len(ret) - attention_mask_sep))
+                'loss_mask':  build_loss_mask(attention_mask_sep)
                 }
 
     elif dataset_type == 'TextCodeDataset':
         def process_fn(row):
             text, code = row[0], row[1].flatten()
             ret = TextCodeTemplate(text, code)
-            ret, attention_mask_sep = pad_to_len(ret)
-            return {'text': ret, 
-                'loss_mask':  np.array([1] * attention_mask_sep + [0] * (len(ret) - attention_mask_sep))
+            # fast path: the image code has a fixed length and texts are short,
+            # so the template nearly always fits in ml and needs no length checks.
+            out = np.empty(ml, dtype=np.int32)
+            try:
+                out[:len(ret)] = ret
+            except ValueError: # longer than ml, truncate with a warning.
+                out, attention_mask_sep = pad_to_len(ret)
+            else:
+                attention_mask_sep = len(ret)
+                out[attention_mask_sep:] = pad_id
+            return {'text': out, 
+                'loss_mask':  build_loss_mask(attention_mask_sep)
                 }
+
+    elif dataset_type == 'FixedLengthTokenizedDataset':
+        # already padded to ml by preprocess/fixed_length_data.py
+        def process_fn(row):
+            seq_len, = FIXED_LENGTH_HEADER.unpack_from(row)
+            text = np.frombuffer(row, dtype=np.int32, offset=FIXED_LENGTH_HEADER.size)
+            return {'text': text.copy(), 
+                'loss_mask': build_loss_mask(seq_len)
+                }
+        return DS_CLASS(path, process_fn, decode_fn=None)
+
     return DS_CLASS(path, process_fn)
 
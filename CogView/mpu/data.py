@@ -23,11 +23,25 @@ from .initialize import get_model_parallel_src_rank
 _MAX_DATA_DIM = 5
 
 
+def _can_view_as_bytes():
+    """Whether tensors can be viewed as a dtype of another element size."""
+    try:
+        torch.zeros(1, dtype=torch.int32).view(torch.uint8)
+    except RuntimeError:
+        return False
+    return True
+
+
+_VIEW_AS_BYTES = _can_view_as_bytes()
+
+
 def _check_data_types(keys, data, target_dtype):
-    """Check that all the keys have the same target data type."""
+    """Check that all the keys have their target data type, a single dtype
+    for all of them or a {key: dtype} dictionary."""
     for key in keys:
-        assert data[key].dtype == target_dtype, '{} has data type {} which '\
-            'is different than {}'.format(key, data[key].dtype, target_dtype)
+        dtype = target_dtype[key] if isinstance(target_dtype, dict) else target_dtype
+        assert data[key].dtype == dtype, '{} has data type {} which '\
+            'is different than {}'.format(key, data[key].dtype, dtype)
 
 
 def _build_key_size_numel_dictionaries(keys, data):
@@ -81,36 +95,60 @@ def broadcast_data(keys, data, datatype):
         keys: list of keys in the data disctionary to be broadcasted
         data: data dictionary of string keys and cpu tensor values.
         datatype: torch data type of all tensors in data associated
-                  with keys.
+                  with keys, or a {key: data type} dictionary.
     """
+    if not isinstance(datatype, dict):
+        datatype = {key: datatype for key in keys}
+
     # Build (key, size) and (key, number of elements) dictionaries along
     # with the total number of elements on all ranks.
     key_size, key_numel, total_numel = _build_key_size_numel_dictionaries(keys,
                                                                           data)
 
+    # Keys are packed into one flat buffer per data type, the widest data
+    # types first so that every buffer stays aligned in the byte buffer below.
+    groups = {}
+    for key in keys:
+        groups.setdefault(datatype[key], []).append(key)
+    dtypes = sorted(groups, key=lambda dtype: -torch.empty(0, dtype=dtype).element_size())
+
     # Pack on rank zero.
     if get_model_parallel_rank() == 0:
-        # Check that all keys have the same data type.
+        # Check that all keys have their data type.
         _check_data_types(keys, data, datatype)
         # Flatten the data associated with the keys
-        flatten_data = torch.cat(
-            [data[key].contiguous().view(-1) for key in keys], dim=0).cuda()
+        flatten_data = [torch.cat(
+            [data[key].contiguous().view(-1) for key in groups[dtype]], dim=0).cuda()
+            for dtype in dtypes]
     else:
-        flatten_data = torch.empty(total_numel,
-                                   device=torch.cuda.current_device(),
-                                   dtype=datatype)
+        flatten_data = [torch.empty(sum(key_numel[key] for key in groups[dtype]),
+                                    device=torch.cuda.current_device(),
+                                    dtype=dtype) for dtype in dtypes]
 
     # Boradcast
-    torch.distributed.broadcast(flatten_data, get_model_parallel_src_rank(),
-                                group=get_model_parallel_group())
+    if len(dtypes) > 1 and _VIEW_AS_BYTES:
+        # Several data types still go out in a single broadcast, as bytes.
+        byte_data = torch.cat([flat.view(torch.uint8) for flat in flatten_data], dim=0)
+        torch.distributed.broadcast(byte_data, get_model_parallel_src_rank(),
+                                    group=get_model_parallel_group())
+        offset = 0
+        for i, flat in enumerate(flatten_data):
+            num_bytes = flat.numel() * flat.element_size()
+            flatten_data[i] = byte_data.narrow(0, offset, num_bytes).view(flat.dtype)
+            offset += num_bytes
+    else:
+        for flat in flatten_data:
+            torch.distributed.broadcast(flat, get_model_parallel_src_rank(),
+                                        group=get_model_parallel_group())
 
     # Unpack
     output = {}
-    offset = 0
-    for key in keys:
-        size = key_size[key]
-        numel = key_numel[key]
-        output[key] = flatten_data.narrow(0, offset, numel).view(size)
-        offset += numel
+    for dtype, flat in zip(dtypes, flatten_data):
+        offset = 0
+        for key in groups[dtype]:
+            size = key_size[key]
+            numel = key_numel[key]
+            output[key] = flat.narrow(0, offset, numel).view(size)
+            offset += numel
 
     return output
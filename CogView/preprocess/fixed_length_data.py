@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+'''
+Convert a TokenizedDataset lmdb into a FixedLengthTokenizedDataset lmdb.
+'''
+
+import os
+import sys
+from tqdm import tqdm
+import argparse
+
+import numpy as np
+import lmdb
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_utils.datasets import FIXED_LENGTH_HEADER, deserialize_row
+
+
+def convert_to_fixed_length(src_path, dst_path, max_len, pad_id):
+    '''
+        Rewrite a TokenizedDataset lmdb into FixedLengthTokenizedDataset records,
+        each row is padded/truncated to max_len once here instead of at every read.
+    '''
+    map_size = 1024 * 1024 * 1024 * 1024
+    src_env = lmdb.open(src_path, readonly=True, lock=False, readahead=False, meminit=False)
+    dst_env = lmdb.open(dst_path, map_size=map_size, writemap=True)
+    buf = np.empty(max_len, dtype=np.int32)
+    with src_env.begin(write=False) as src_txn, dst_env.begin(write=True) as txn:
+        length = int(src_txn.get('length'.encode('utf-8')).decode('utf-8'))
+        for index in tqdm(range(length)):
+            key = str(index).encode('utf-8')
+            row = deserialize_row(src_txn.get(key)).flatten()
+            seq_len = min(len(row), max_len)
+            buf.fill(pad_id)
+            buf[:seq_len] = row[:seq_len]
+            txn.put(key, FIXED_LENGTH_HEADER.pack(seq_len) + buf.tobytes())
+        txn.put('length'.encode('utf-8'), str(length).encode('utf-8'))
+    print(f'{dst_path}, length={length}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="convert to fixed length lmdb")
+    parser.add_argument("--src", type=str, required=True)
+    parser.add_argument("--dst", type=str, required=True)
+    parser.add_argument("--max-len", type=int, required=True,
+                        help='must equal --max-position-embeddings of the training run')
+    parser.add_argument("--img_tokenizer_path", type=str, default=None)
+    parser.add_argument("--img_tokenizer_num_tokens", type=int, default=None)
+    args = parser.parse_args()
+    print(args)
+
+    from data_utils import get_tokenizer
+    tokenizer = get_tokenizer(args)
+    convert_to_fixed_length(args.src, args.dst, args.max_len, tokenizer['[PAD]'])
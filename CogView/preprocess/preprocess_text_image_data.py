@@ -19,6 +19,7 @@ import torch.nn.functional as F
 from torch.utils.data import DataLoader
 from torchvision import transforms
 import lmdb
+from data_utils.datasets import serialize_row
 from .pretokenized_data import make_text_image_batch, make_tuple_text_image_batch, make_super_resolution_batch
 import PIL
 import timeit
@@ -56,7 +57,7 @@ def extract_code(model, datasets, text_dict, name, device, txt_type):
                     else:
                         codes = make_tuple_text_image_batch(model, txts, imgs)
                     for code in codes:
-                        txn.put(str(index).encode('utf-8'), pickle.dumps(code))
+                        txn.put(str(index).encode('utf-8'), serialize_row(code))
                         index += 1
                 except KeyError:
                     print("warning: KeyError. The text cannot be find")
@@ -95,7 +96,7 @@ def extract_code_super_resolution_patches(model, datasets, text_dict, name, devi
                     else:
                         codes = make_tuple_text_image_batch(model, txts, imgs)
                     for code in codes:
-                        txn.put(str(index).encode('utf-8'), pickle.dumps(code))
+                        txn.put(str(index).encode('utf-8'), serialize_row(code))
                         index += 1
                 except KeyError:
                     print("warning: KeyError. The text cannot be find")
@@ -19,6 +19,7 @@ import torch.nn.functional as F
 from torch.utils.data import DataLoader
 from torchvision import transforms
 import lmdb
+from data_utils.datasets import serialize_row
 from .pretokenized_data import make_cut_text_batch
 import timeit
 import ujson as json
@@ -40,7 +41,7 @@ def extract_code(datasets, name, seq_len):
                 txts = [t["content"] for t in raw_json[i: i + bs]]
                 txts = make_cut_text_batch(txts, seq_len)
                 for code in txts:
-                    txn.put(str(index).encode('utf-8'), pickle.dumps(code))
+                    txn.put(str(index).encode('utf-8'), serialize_row(code))
                     index += 1
         txn.put('length'.encode('utf-8'), str(index).encode('utf-8'))
     print(f'/root/mnt/lmdb/{name}, length={index}')
@@ -256,7 +256,9 @@ def get_masks_and_position_ids(data,
 def get_batch(data_iterator, args, timers):
     # Items and their type.
     keys = ['text', 'loss_mask']
-    datatype = torch.int64
+    # token ids are int32 and loss_mask is uint8 on the host, both go out in a
+    # single broadcast and are cast after they are on the GPU.
+    datatype = {'text': torch.int32, 'loss_mask': torch.uint8}
 
     # Broadcast data.
     timers('data loader').start()
@@ -763,7 +765,14 @@ def main():
         summary_writer = get_sample_writer(base=args.summary_dir, name=args.experiment_name, iteration=args.iteration)
 
     # Resume data loader if necessary.
-    if args.resume_dataloader:
+    if args.resume_dataloader and args.lmdb_batched_read:
+        # LMDBBatchedDataset counts the batches of this rank.
+        if train_data is not None:
+            train_data.dataset.start_iter = args.iteration * (args.gradient_accumulation_steps or 1)
+        if val_data is not None:
+            val_data.dataset.start_iter = (args.train_iters // args.save_interval) * \
+                                          args.eval_interval
+    elif args.resume_dataloader:
         if train_data is not None:
             train_data.batch_sampler.start_iter = args.iteration % \
                                                   len(train_data)
@@ -22,10 +22,10 @@ def update(env, sid, name):
     txn.commit()
 
 
-import pickle
+from data_utils.datasets import deserialize_row
 def search(env, sid):
     txn = env.begin()
-    data = pickle.loads(txn.get(str(sid).encode('utf-8')))
+    data = deserialize_row(txn.get(str(sid).encode('utf-8')))
     return data
 
 import argparse
@@ -29,9 +29,10 @@ def process_batch(batch):
     """Process batch and produce inputs for the model."""
     args = get_args()
 
-    tokens = batch['text'].long().cuda().contiguous()
-    labels = batch['label'].long().cuda().contiguous()
-    attention_mask = batch['padding_mask'].float().cuda().contiguous()
+    # Cast after the copy to the GPU, datasets may store narrow dtypes.
+    tokens = batch['text'].cuda().long().contiguous()
+    labels = batch['label'].cuda().long().contiguous()
+    attention_mask = batch['padding_mask'].cuda().float().contiguous()
     max_seq_len = batch['seq_len'].long().max().item()
     max_seq_len = (max_seq_len + 127) // 128 * 128
     if args.fp16:
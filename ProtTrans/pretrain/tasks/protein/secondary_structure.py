@@ -1,9 +1,9 @@
 """Secondary Structure dataset."""
 
 import numpy as np
+import torch
 from megatron import print_rank_0
 from .data import ProteinPredictionAbstractDataset
-from .data import build_tokens_paddings_from_text
 
 class SecondaryStructureDataset(ProteinPredictionAbstractDataset):
     def __init__(self,
@@ -14,29 +14,33 @@ class SecondaryStructureDataset(ProteinPredictionAbstractDataset):
         super().__init__('secondary_structure', name, datapaths, tokenizer, max_seq_length)
 
 
-    def build_samples(self, ids, paddings, label, unique_id, seq_len):
-        """Convert to numpy and return a sample consumed by the batch producer."""
+    def build_samples(self, items):
+        """Tokenize a list of raw samples and pad them into batch arrays."""
+        batch_size = len(items)
+        max_seq_length = self.max_seq_length
+        text_np = np.full((batch_size, max_seq_length), self.tokenizer.pad, dtype=np.int32)
+        text_np[:, 0] = self.tokenizer.cls
+        label_np = np.full((batch_size, max_seq_length), -1, dtype=np.int8)
+        seq_len_np = np.empty(batch_size, dtype=np.int64)
+        for i, item in enumerate(items):
+            ids = self.tokenizer.tokenize(item['primary'])[:max_seq_length - 1]
+            seq_len_np[i] = len(ids) + 1 # +1 because of the [cls] token
+            text_np[i, 1:seq_len_np[i]] = ids
+            num_labels = min(len(item['ss3']) + 1, max_seq_length)
+            label_np[i, 1:num_labels] = item['ss3'][:num_labels - 1]
+        paddings_np = (np.arange(max_seq_length) < seq_len_np[:, None]).astype(np.int32)
+        return {'text': torch.from_numpy(text_np),
+                'padding_mask': torch.from_numpy(paddings_np),
+                'label': torch.from_numpy(label_np),
+                'uid': torch.tensor([item['uid'] for item in items]),
+                'seq_len': torch.from_numpy(seq_len_np)}
 
-        ids_np = np.array(ids, dtype=np.int64)
-        paddings_np = np.array(paddings, dtype=np.int64)
-
-        label = [-1] + label
-        padding_length = self.max_seq_length - len(label)
-        if padding_length > 0:
-            label.extend([-1] * padding_length)
-        label = label[:self.max_seq_length]
-        label_np = np.array(label, dtype=np.int64)
-        sample = ({'text': ids_np,
-                'padding_mask': paddings_np,
-                'label': label_np,
-                'uid': int(unique_id),
-                'seq_len': int(seq_len)})
-        return sample
-    
     def __getitem__(self, index: int):
+        # Tokenization and padding happen per batch in build_samples.
         item = self.samples[index]
-        ids, paddings, seq_len = build_tokens_paddings_from_text(
-            item['primary'], self.tokenizer, self.max_seq_length)
-        seq_len = min(seq_len + 1, self.max_seq_length) # +1 because of the [cls] token
-        sample = self.build_samples(ids, paddings, item['ss3'].tolist(), item['uid'], seq_len)
-        return sample
+        return {'primary': item['primary'],
+                'ss3': item['ss3'],
+                'uid': item['uid']}
+
+    def collate_fn(self, batch):
+        return self.build_samples(batch)
@@ -65,6 +65,13 @@ def add_model_config_args(parser):
                        help='Run optimizer on CPU')
     group.add_argument('--cpu_torch_adam', action='store_true',
                        help='Use Torch Adam as optimizer on CPU.')
+    group.add_argument('--fused-adamw', action='store_true',
+                       help='Use torch.optim.AdamW(fused=True) instead of '
+                            'apex FusedAdam on GPU, needs torch>=2.0.')
+    group.add_argument('--overlap-optim-with-ddp', action='store_true',
+                       help='Step the optimizer per DDP bucket inside the '
+                            'gradient all-reduce hook. Needs --fused-adamw, '
+                            '--clip-grad 0 and no fp16.')
 
     return parser
 
@@ -76,6 +83,13 @@ def add_fp16_config_args(parser):
 
     group.add_argument('--fp16', action='store_true',
                        help='Run model in fp16 mode')
+    group.add_argument('--amp', action='store_true',
+                       help='Run the model under torch.cuda.amp autocast with '
+                            'a GradScaler, instead of the fp16 model and '
+                            'optimizer wrappers of --fp16, needs torch>=1.10')
+    group.add_argument('--bf16', action='store_true',
+                       help='With --amp, autocast to bfloat16 and skip the '
+                            'loss scaling')
     group.add_argument('--fp32-embedding', action='store_true',
                        help='embedding in fp32')
     group.add_argument('--fp32-layernorm', action='store_true',
@@ -84,6 +98,9 @@ def add_fp16_config_args(parser):
                        help='embedding token types in fp32')
     group.add_argument('--fp32-allreduce', action='store_true',
                        help='all-reduce in fp32')
+    group.add_argument('--disable-tf32', action='store_true',
+                       help='Do not use TF32 for fp32 matmuls and convolutions '
+                            'on Ampere and newer GPUs.')
     group.add_argument('--hysteresis', type=int, default=2,
                        help='hysteresis for dynamic loss scaling')
     group.add_argument('--loss-scale', type=float, default=None,
@@ -122,6 +139,11 @@ def add_training_args(parser):
                        help='total number of iterations to train over all training runs')
     group.add_argument('--log-interval', type=int, default=100,
                        help='report interval')
+    group.add_argument('--report-memory-interval', type=int, default=0,
+                       help='also report memory every this many iterations, '
+                            'checked at log iterations, should be a multiple of '
+                            '--log-interval. 0 reports only after the first '
+                            'log interval.')
     group.add_argument('--exit-interval', type=int, default=None,
                        help='Exit the program after this many new iterations.')
     group.add_argument('--summary-dir', type=str, default="", help="The directory to store the summary")
@@ -133,6 +155,13 @@ def add_training_args(parser):
     group.add_argument('--reset-attention-mask', action='store_true',
                        help='Reset self attention maske after '
                             'end-of-document token.')
+    group.add_argument('--compile-masks', action='store_true',
+                       help='torch.compile the EOD loss mask / position id / '
+                            'attention mask resets, needs torch>=2.0.')
+    group.add_argument('--compact-mask', action='store_true',
+                       help='Do not build the causal attention mask in the '
+                            'batch, the model builds it from the lengths. '
+                            'Ignored with --reset-attention-mask and --xl-dataset.')
 
     # Learning rate.
     group.add_argument('--lr-decay-iters', type=int, default=None,
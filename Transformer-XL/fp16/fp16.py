@@ -57,12 +57,16 @@ def fp16_to_fp32(val):
     return conversion_helper(val, float_conversion)
 
 class FP16_Module(nn.Module):
-    def __init__(self, module):
+    def __init__(self, module, fp32_outputs=True):
         super(FP16_Module, self).__init__()
         self.add_module('module', module.half())
+        # With fp32_outputs=False the half outputs are returned as they are,
+        # for consumers that upcast them themselves.
+        self.fp32_outputs = fp32_outputs
 
     def forward(self, *inputs, **kwargs):
-        return fp16_to_fp32(self.module(*(fp32_to_fp16(inputs)), **kwargs))
+        outputs = self.module(*(fp32_to_fp16(inputs)), **kwargs)
+        return fp16_to_fp32(outputs) if self.fp32_outputs else outputs
 
     def state_dict(self, destination=None, prefix='', keep_vars=False):
         return self.module.state_dict(destination, prefix, keep_vars)
@@ -262,7 +266,10 @@ class FP16_Optimizer(object):
                      p.grad = None
                  else:
                      if p.grad is not None:
-                         p.grad.detach_()
+                         if p.grad.grad_fn is not None:
+                             p.grad.detach_()
+                         else:
+                             p.grad.requires_grad_(False)
                          p.grad.zero_()
 
         # Zero fp16 gradients owned by the model:
@@ -272,7 +279,12 @@ class FP16_Optimizer(object):
                     param.grad = None
                 else:
                     if param.grad is not None:
-                        param.grad.detach_() # as in torch.optim.optimizer.zero_grad()
+                        # as in torch.optim.optimizer.zero_grad(), grads that are
+                        # views into the DDP buckets can't be detached in place.
+                        if param.grad.grad_fn is not None:
+                            param.grad.detach_()
+                        else:
+                            param.grad.requires_grad_(False)
                         param.grad.zero_()
 
     def _check_overflow(self):
@@ -85,6 +85,11 @@ def get_model(args):
     return model
 
 
+# Attention masks that only depend on the shapes, keyed by
+# (seq_length, mem_length, device) and shared between calls.
+_ATTENTION_MASK_CACHE = {}
+
+
 def get_masks_and_position_ids(data,
                                eod_token,
                                reset_position_ids,
@@ -99,17 +104,26 @@ def get_masks_and_position_ids(data,
     # Attention mask (lower triangular).
     if transformer_xl:
         if attention_mask is None:
-            attention_mask = torch.ones((1, seq_length, seq_length + mem_length), device=data.device)
-        attention_mask = torch.tril(torch.triu(attention_mask, 1 - seq_length + mem_length), mem_length)
+            key = (seq_length, mem_length, data.device)
+            if key not in _ATTENTION_MASK_CACHE:
+                attention_mask = torch.ones((1, seq_length, seq_length + mem_length), device=data.device)
+                attention_mask = torch.tril(torch.triu(attention_mask, 1 - seq_length + mem_length), mem_length)
+                _ATTENTION_MASK_CACHE[key] = attention_mask.unsqueeze(1)
+            attention_mask = _ATTENTION_MASK_CACHE[key]
+        else:
+            attention_mask = torch.tril(torch.triu(attention_mask, 1 - seq_length + mem_length), mem_length)
+            attention_mask = attention_mask.unsqueeze(1)
     else:
-        if reset_attention_mask:
-            att_mask_batch = batch_size
+        if attention_mask is None and not reset_attention_mask:
+            key = (seq_length, None, data.device)
+            if key not in _ATTENTION_MASK_CACHE:
+                attention_mask = torch.ones((1, seq_length, seq_length), device=data.device)
+                _ATTENTION_MASK_CACHE[key] = torch.tril(attention_mask).unsqueeze(1)
+            attention_mask = _ATTENTION_MASK_CACHE[key]
         else:
-            att_mask_batch = 1
-        if attention_mask is None:
-            attention_mask = torch.ones((att_mask_batch, seq_length, seq_length), device=data.device)
-        attention_mask = torch.tril(attention_mask)
-    attention_mask = attention_mask.unsqueeze(1)
+            if attention_mask is None:
+                attention_mask = torch.ones((batch_size, seq_length, seq_length), device=data.device)
+            attention_mask = torch.tril(attention_mask).unsqueeze(1)
 
     # Loss mask.
     if loss_mask is None:
@@ -120,32 +134,21 @@ def get_masks_and_position_ids(data,
                                 device=data.device)
     position_ids = position_ids.unsqueeze(0).expand_as(data)
     if not transformer_xl:
-        loss_mask[data == eod_token] = 0.0
-        # We need to clone as the ids will be modifed based on batch index.
+        is_eod = data == eod_token
+        loss_mask[is_eod] = 0.0
+
+        # A new document starts right after each EOD token, the EOD token
+        # itself still belongs to the previous one.
         if reset_position_ids:
-            position_ids = position_ids.clone()
-
-        if reset_position_ids or reset_attention_mask:
-            # Loop through the batches:
-            for b in range(batch_size):
-
-                # Find indecies where EOD token is.
-                eod_index = position_ids[b, data[b] == eod_token]
-                # Detach indecies from positions if going to modify positions.
-                if reset_position_ids:
-                    eod_index = eod_index.clone()
-
-                # Loop through EOD indecies:
-                prev_index = 0
-                for j in range(eod_index.size()[0]):
-                    i = eod_index[j]
-                    # Mask attention loss.
-                    if reset_attention_mask:
-                        attention_mask[b, 0, (i + 1):, :(i + 1)] = 0
-                    # Reset positions.
-                    if reset_position_ids:
-                        position_ids[b, (i + 1):] -= (i + 1 - prev_index)
-                        prev_index = i + 1
+            doc_start = torch.where(is_eod, position_ids + 1, torch.zeros_like(position_ids))
+            doc_start = doc_start.cummax(dim=1).values
+            doc_start = torch.cat((doc_start.new_zeros(batch_size, 1), doc_start[:, :-1]), dim=1)
+            position_ids = position_ids - doc_start
+
+        if reset_attention_mask:
+            doc_ids = is_eod.long().cumsum(dim=1) - is_eod.long()
+            same_doc = doc_ids.unsqueeze(2) == doc_ids.unsqueeze(1)
+            attention_mask = attention_mask * same_doc.unsqueeze(1)
 
     return attention_mask, loss_mask, position_ids
 
@@ -211,7 +214,7 @@ def setup_model(args):
 def get_batch(context_tokens, device, args):
     tokens = context_tokens
     tokens = tokens.view(args.batch_size, -1).contiguous()
-    tokens = tokens.to(device)
+    tokens = tokens.to(device, non_blocking=True)
 
     # Get the masks and postition ids.
     attention_mask, loss_mask, position_ids = get_masks_and_position_ids(
@@ -225,36 +228,37 @@ def get_batch(context_tokens, device, args):
     return tokens, attention_mask, position_ids
 
 
-def top_k_logits(logits, top_k=0, top_p=0.0, filter_value=-float('Inf')):
-    # This function has been mostly taken from huggingface conversational ai code at
-    # https://medium.com/huggingface/how-to-build-a-state-of-the-art-conversational-ai-with-transfer-learning-2d818ac26313
+def top_k_candidates(logits, top_k=0, top_p=0.0, temperature=1.0, filter_value=-float('Inf')):
+    # Same filtering as the huggingface top_k_logits, but only the kept candidates
+    # are sorted and normalized instead of the whole vocab.
+    # Returns the candidate logits sorted in descending order and their token ids,
+    # or (logits, None) if no filtering is applied.
+    # The temperature does not change the order, so it is applied to the
+    # candidates only, before the top_p softmax that does depend on it.
 
     if top_k > 0:
-        # Remove all tokens with a probability less than the last token of the top-k
-        indices_to_remove = logits < torch.topk(logits, top_k)[0][..., -1, None]
-        logits[indices_to_remove] = filter_value
+        logits, indices = torch.topk(logits, top_k)
+    elif top_p > 0.0:
+        logits, indices = torch.sort(logits, descending=True)
+    else:
+        return logits / temperature, None
+    logits = logits / temperature
 
     if top_p > 0.0:
-        # convert to 1D
-        logits = logits.view(logits.size()[1]).contiguous()
-        sorted_logits, sorted_indices = torch.sort(logits, descending=True)
-        cumulative_probs = torch.cumsum(F.softmax(sorted_logits, dim=-1), dim=-1)
+        cumulative_probs = torch.cumsum(F.softmax(logits, dim=-1), dim=-1)
 
         # Remove tokens with cumulative probability above the threshold
-        sorted_indices_to_remove = cumulative_probs > top_p
+        indices_to_remove = cumulative_probs > top_p
         # Shift the indices to the right to keep also the first token above the threshold
-        sorted_indices_to_remove[..., 1:] = sorted_indices_to_remove[..., :-1].clone()
-        sorted_indices_to_remove[..., 0] = 0
-        indices_to_remove = sorted_indices[sorted_indices_to_remove]
-        logits[indices_to_remove] = filter_value
-        # going back to 2D
-        logits = logits.view(1, -1).contiguous()
+        indices_to_remove[..., 1:] = indices_to_remove[..., :-1].clone()
+        indices_to_remove[..., 0] = 0
+        logits = logits.masked_fill(indices_to_remove, filter_value)
 
-    return logits
+    return logits, indices
 
 
 def sample_sequence(model, tokenizer, context_tokens_tensor, context_length, args, device, mems=None, end_token=None):
-    tokens, attention_mask, position_ids = get_batch(context_tokens_tensor, device, args)
+    context_tokens, attention_mask, position_ids = get_batch(context_tokens_tensor, device, args)
 
     counter = 0
     if mems is None:
@@ -262,33 +266,44 @@ def sample_sequence(model, tokenizer, context_tokens_tensor, context_length, arg
     if end_token is None:
         end_token = args.eod_token
     org_context_length = context_length
+    # Write the sampled tokens into a preallocated buffer instead of growing it with torch.cat.
+    tokens = context_tokens.new_empty((1, max(args.out_seq_length, org_context_length)))
+    tokens[:, :org_context_length] = context_tokens
+    # Inputs of the single token steps, reused instead of allocated every step.
+    step_attention_mask = tokens.new_ones(1, 1, 1, args.mem_length + 1, dtype=torch.float)
+    step_position_ids = tokens.new_zeros((1, 1))
+    output_ids, last_decoded_length = [], 0
     while counter < (args.out_seq_length - org_context_length):
         if counter == 0:
-            logits, *mems = model(tokens, position_ids, attention_mask, *mems)
+            logits, *mems = model(context_tokens, position_ids, attention_mask, *mems)
         else:
             index = org_context_length + counter
-            logits, *mems = model(tokens[:, index - 1: index], tokens.new_ones((1, 1)) * (index - 1),
-                                  tokens.new_ones(1, 1, 1, args.mem_length + 1, device=tokens.device,
-                                                  dtype=torch.float), *mems)
+            step_position_ids.fill_(index - 1)
+            logits, *mems = model(tokens[:, index - 1: index], step_position_ids,
+                                  step_attention_mask, *mems)
         logits = logits[:, -1]
-        logits /= args.temperature
-        logits = top_k_logits(logits, top_k=args.top_k, top_p=args.top_p)
-        log_probs = F.softmax(logits, dim=-1)
-        prev = torch.multinomial(log_probs, num_samples=1)[0]
+        logits, indices = top_k_candidates(logits, top_k=args.top_k, top_p=args.top_p,
+                                           temperature=args.temperature)
+        probs = F.softmax(logits, dim=-1)
+        prev = torch.multinomial(probs, num_samples=1)
+        if indices is not None:
+            prev = indices.gather(-1, prev)
+        prev = prev[0]
         is_end = prev == end_token
         if is_end:
             break
-        tokens = torch.cat((tokens, prev.view(1, 1)), dim=1)
+        tokens[:, context_length] = prev
         context_length += 1
         counter += 1
-        if mpu.get_model_parallel_rank() == 0 and counter % 16 == 0:
-            output_tokens_list = tokens.view(-1).contiguous()
-            decode_tokens = tokenizer.DecodeIds(output_tokens_list.tolist())
-            if mpu.get_model_parallel_rank() == 0 and (counter % 128 == 0 or is_end):
-                os.system('clear')
-                trim_decode_tokens = decode_tokens
-                print(trim_decode_tokens, flush=True)
-    output_tokens_list = tokens.view(-1).contiguous()
+        if mpu.get_model_parallel_rank() == 0 and counter % 128 == 0:
+            # Only copy what was sampled since the last print, .tolist() syncs with
+            # the GPU. The whole prefix is decoded, decoding the new tokens alone
+            # would drop the space of a word starting right at the boundary.
+            output_ids.extend(tokens[0, last_decoded_length:context_length].tolist())
+            last_decoded_length = context_length
+            os.system('clear')
+            print(tokenizer.DecodeIds(output_ids), flush=True)
+    output_tokens_list = tokens[0, :context_length]
     return output_tokens_list, mems
 
 
@@ -31,6 +31,36 @@ class PyTorchDistributedDataParallel(DDP):
     def load_state_dict(self, state_dict, strict=True):
         self.module.load_state_dict(state_dict, strict=strict)
 
+    def register_optimizer_hook(self, optimizer):
+        """Run optimizer.step on the params of each gradient bucket as soon as
+        its all-reduce is done, overlapping the update with the rest of the
+        backward pass. The optimizer must keep its step counts per param."""
+        process_group = self.process_group
+
+        def allreduce_then_step(state, bucket):
+            buffer = bucket.buffer().div_(process_group.size())
+            fut = dist.all_reduce(buffer, group=process_group, async_op=True).get_future()
+
+            def step(fut):
+                bucket_params = bucket.parameters()
+                for param, grad in zip(bucket_params, bucket.gradients()):
+                    param.grad = grad
+                # Step only this bucket, the groups keep their current lr.
+                bucket_params = set(bucket_params)
+                param_groups = optimizer.param_groups
+                optimizer.param_groups = [
+                    dict(group, params=[p for p in group['params'] if p in bucket_params])
+                    for group in param_groups]
+                try:
+                    optimizer.step()
+                finally:
+                    optimizer.param_groups = param_groups
+                return fut.value()[0]
+
+            return fut.then(step)
+
+        self.register_comm_hook(None, allreduce_then_step)
+
 
 class DistributedDataParallel(Module):
 
@@ -98,21 +98,20 @@ class GPT2Model(torch.nn.Module):
         return (mpu.gather_from_model_parallel_region(logits_parallel), *hidden_layers)
 
 
+_LAYER_NORM_TYPES = (mpu.LayerNorm, torch.nn.LayerNorm)
+
+
 def gpt2_get_params_for_weight_decay_optimization(module):
 
     weight_decay_params = {'params': []}
     no_weight_decay_params = {'params': [], 'weight_decay': 0.0}
     for module_ in module.modules():
-        if isinstance(module_, (mpu.LayerNorm, torch.nn.LayerNorm)):
-            no_weight_decay_params['params'].extend(
-                [p for p in list(module_._parameters.values())
-                 if p is not None])
-        else:
-            weight_decay_params['params'].extend(
-                [p for n, p in list(module_._parameters.items())
-                 if p is not None and n != 'bias'])
-            no_weight_decay_params['params'].extend(
-                [p for n, p in list(module_._parameters.items())
-                 if p is not None and n == 'bias'])
+        # LayerNorm parameters and biases are not decayed.
+        is_layer_norm = isinstance(module_, _LAYER_NORM_TYPES)
+        for n, p in module_.named_parameters(recurse=False):
+            if is_layer_norm or n == 'bias':
+                no_weight_decay_params['params'].append(p)
+            else:
+                weight_decay_params['params'].append(p)
 
     return weight_decay_params, no_weight_decay_params
@@ -27,8 +27,10 @@ class _VocabParallelCrossEntropy(torch.autograd.Function):
     @staticmethod
     def forward(ctx, vocab_parallel_logits, target):
 
-        # Copy so the input remains unchanged.
-        logits = vocab_parallel_logits.clone()
+        # Copy so the input remains unchanged. The copy is also the upcast to
+        # fp32, so half logits need no separate .float() copy by the caller.
+        logits = vocab_parallel_logits.to(torch.float32, memory_format=torch.contiguous_format,
+                                          copy=True)
         # Maximum value along vocab dimension across all GPUs.
         logits_max = torch.max(logits, dim=-1)[0]
         torch.distributed.all_reduce(logits_max,
@@ -36,12 +38,6 @@ class _VocabParallelCrossEntropy(torch.autograd.Function):
                                      group=get_model_parallel_group())
         # Subtract the maximum value.
         logits.sub_(logits_max.unsqueeze(dim=-1))
-        # Sum of exponential of logits along vocab dimension across all GPUs.
-        exp_logits = logits.exp()
-        sum_exp_logits = exp_logits.sum(dim=-1)
-        torch.distributed.all_reduce(sum_exp_logits,
-                                     op=torch.distributed.ReduceOp.SUM,
-                                     group=get_model_parallel_group())
 
         # Get the partition's vocab indecies
         get_vocab_range = VocabUtility.vocab_range_from_per_partition_vocab_size
@@ -66,6 +62,15 @@ class _VocabParallelCrossEntropy(torch.autograd.Function):
         predicted_logits_1d = logits_2d[arange_1d, masked_target_1d]
         predicted_logits = predicted_logits_1d.view_as(target)
         predicted_logits[target_mask] = 0.0
+
+        # Sum of exponential of logits along vocab dimension across all GPUs.
+        # The logits are not needed any more, so exponentiate in place.
+        exp_logits = logits.exp_()
+        sum_exp_logits = exp_logits.sum(dim=-1)
+        torch.distributed.all_reduce(sum_exp_logits,
+                                     op=torch.distributed.ReduceOp.SUM,
+                                     group=get_model_parallel_group())
+
         # All reduce is needed to get the chunks from other GPUs.
         torch.distributed.all_reduce(predicted_logits,
                                      op=torch.distributed.ReduceOp.SUM,
@@ -77,6 +82,7 @@ class _VocabParallelCrossEntropy(torch.autograd.Function):
         # Store softmax, target-mask and masked-target for backward pass.
         exp_logits.div_(sum_exp_logits.unsqueeze(dim=-1))
         ctx.save_for_backward(exp_logits, target_mask, masked_target_1d)
+        ctx.logits_dtype = vocab_parallel_logits.dtype
 
         return loss
 
@@ -101,7 +107,7 @@ class _VocabParallelCrossEntropy(torch.autograd.Function):
         # Finally elementwise multiplication with the output gradients.
         grad_input.mul_(grad_output.unsqueeze(dim=-1))
 
-        return grad_input, None
+        return grad_input.to(ctx.logits_dtype), None
 
 
 def vocab_parallel_cross_entropy(vocab_parallel_logits, target):
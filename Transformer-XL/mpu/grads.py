@@ -19,7 +19,7 @@
 
 
 import torch
-from torch._six import inf
+from math import inf
 
 from .initialize import get_model_parallel_group
 from .initialize import get_model_parallel_rank
@@ -35,13 +35,13 @@ PA_CORRECTNESS_TEST= False
 def see_memory_usage(message, force=False):
     if not force:
         return
-    dist.barrier()
+    # No barrier, rank 0 only reads its own allocator state.
     if dist.get_rank() == 0:
         print(message)
         print("Memory Allocated ", torch.cuda.memory_allocated()/(1024*1024*1024), "GigaBytes")
         print("Max Memory Allocated ", torch.cuda.max_memory_allocated()/(1024*1024*1024), "GigaBytes")
-        print("Cache Allocated ", torch.cuda.memory_cached()/(1024*1024*1024), "GigaBytes")
-        print("Max cache Allocated ", torch.cuda.max_memory_cached()/(1024*1024*1024), "GigaBytes")
+        print("Cache Allocated ", torch.cuda.memory_reserved()/(1024*1024*1024), "GigaBytes")
+        print("Max cache Allocated ", torch.cuda.max_memory_reserved()/(1024*1024*1024), "GigaBytes")
         print(" ")
         #input("Press Any Key To Continue ..")
 
@@ -308,6 +308,8 @@ class CheckpointFunction(torch.autograd.Function):
         ctx.fwd_cpu_rng_state = torch.get_rng_state()
         ctx.fwd_cuda_rng_state = torch.cuda.get_rng_state()
         ctx.fwd_cuda_rng_state_tracker = get_cuda_rng_tracker().get_states()
+        # Backward recomputes under the same autocast, like torch.utils.checkpoint.
+        ctx.fwd_autocast_dtype = torch.get_autocast_gpu_dtype() if torch.is_autocast_enabled() else None
 
         #ctx.save_for_backward(*args)
         with torch.no_grad():
@@ -358,7 +360,11 @@ class CheckpointFunction(torch.autograd.Function):
             current_stream=torch.cuda.current_stream()
             current_stream.wait_stream(transport_stream)
 
-        with torch.enable_grad():
+        if ctx.fwd_autocast_dtype is None:
+            autocast = torch.cuda.amp.autocast(enabled=False)
+        else:
+            autocast = torch.cuda.amp.autocast(dtype=ctx.fwd_autocast_dtype)
+        with torch.enable_grad(), autocast:
             outputs = ctx.run_function(*detached_inputs)
 
         # Set the states back to what it was at the start of this function.
@@ -70,6 +70,18 @@ def test_boradcast_data(model_parallel_size):
         tensor = data_t[key].cuda()
         assert data_b[key].sub(tensor).abs().max() == 0
 
+    # Per key data types.
+    key_dtype = {'key1': torch.int64, 'key3': torch.uint8, 'keyX': torch.float}
+    data_t['key3'] = data_t['key3'].byte()
+    if data is not None:
+        data['key3'] = data['key3'].byte()
+    data_utils._check_data_types(list(key_dtype), data_t, key_dtype)
+    data_b = data_utils.broadcast_data(list(key_dtype), data, key_dtype)
+    for key in key_dtype:
+        tensor = data_t[key].cuda()
+        assert data_b[key].dtype == key_dtype[key]
+        assert data_b[key].sub(tensor).abs().max() == 0
+
     # Reset groups
     mpu.destroy_model_parallel()
 
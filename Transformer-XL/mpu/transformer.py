@@ -215,9 +215,9 @@ class GPT2ParallelSelfAttention(torch.nn.Module):
             attention_scores = torch.matmul(query_layer, key_layer.transpose(-1, -2))
         attention_scores = attention_scores / math.sqrt(
             self.hidden_size_per_attention_head)
-        # Apply the left to right attention mask.
-        attention_scores = torch.mul(attention_scores, ltor_mask) - \
-                           10000.0 * (1.0 - ltor_mask)
+        # Apply the left to right attention mask, already turned into an
+        # additive 0 / -10000 bias by GPT2ParallelTransformer.
+        attention_scores = attention_scores + ltor_mask
 
         # Attention probabilities. [b, np, s, s]
         attention_probs = torch.nn.Softmax(dim=-1)(attention_scores)
@@ -529,7 +529,16 @@ class GPT2ParallelTransformer(torch.nn.Module):
         batch_size, query_length = hidden_states.size()[:2]
         memory_length = mems[0].size(1) if mems else 0
         key_length = query_length + memory_length
-        attention_mask = attention_mask[:, :, :, -query_length - memory_length:]
+        if attention_mask is None:
+            # Compact mask: every query sees the memory and the keys up to itself.
+            query_ids = torch.arange(query_length, device=hidden_states.device).unsqueeze(1)
+            key_ids = torch.arange(key_length, device=hidden_states.device)
+            dtype = torch.get_autocast_gpu_dtype() if torch.is_autocast_enabled() else hidden_states.dtype
+            attention_mask = ((key_ids - query_ids) > memory_length).to(dtype) * -10000.0
+        else:
+            attention_mask = attention_mask[:, :, :, -query_length - memory_length:]
+            # Convert the 0/1 mask to an additive bias once for all the layers.
+            attention_mask = (1.0 - attention_mask) * -10000.0
         if self.relative_encoding:
             hidden_states = self.embedding_dropout(hidden_states)
             position_sequence = torch.arange(key_length - 1, -1, -1.0, device=hidden_states.device,
@@ -45,6 +45,7 @@ from utils import Timers, set_random_seed
 from utils import save_checkpoint
 from utils import load_checkpoint
 from utils import report_memory
+from utils import CUDAPrefetcher
 from utils import print_args
 from utils import print_rank_0
 from utils import get_sample_writer
@@ -52,6 +53,16 @@ import torch.distributed as dist
 
 from gpt2_data_loader import make_gpt2_dataloaders
 
+TORCH_VERSION = tuple(int(v) for v in torch.__version__.split('.')[:2])
+
+
+def inference_mode(mode=True):
+    """torch.inference_mode, which is torch>=1.9. Before that evaluate falls
+    back to no_grad and there are no inference tensors to keep out of caches."""
+    if TORCH_VERSION >= (1, 9):
+        return torch.inference_mode(mode)
+    return torch.no_grad() if mode else ExitStack()
+
 
 def get_model(args):
     """Build the model."""
@@ -85,14 +96,25 @@ def get_model(args):
 
     # Fp16 conversion.
     if args.fp16:
-        model = FP16_Module(model)
+        # The logits stay half, vocab_parallel_cross_entropy upcasts them in
+        # its own copy, and the mems go back into the model as half anyway.
+        model = FP16_Module(model, fp32_outputs=False)
 
     # Wrap model for distributed training.
     if not args.deepspeed:
         if USE_TORCH_DDP:
             i = torch.cuda.current_device()
+            # Grads are views into the all-reduce buckets instead of being
+            # copied in and out of them (torch>=1.7), and the bucket order is
+            # reused (torch>=1.11).
+            ddp_kwargs = {}
+            if TORCH_VERSION >= (1, 7):
+                ddp_kwargs['gradient_as_bucket_view'] = True
+            if TORCH_VERSION >= (1, 11):
+                ddp_kwargs['static_graph'] = True
             model = DDP(model, device_ids=[i], output_device=i,
-                        process_group=mpu.get_data_parallel_group())
+                        process_group=mpu.get_data_parallel_group(),
+                        bucket_cap_mb=50, **ddp_kwargs)
         else:
             model = DDP(model)
 
@@ -126,6 +148,11 @@ def get_optimizer(param_groups, args):
             cpu_adam_optimizer = DeepSpeedCPUAdam
         optimizer = cpu_adam_optimizer(param_groups,
                         lr=args.lr, weight_decay=args.weight_decay)
+    elif args.fused_adamw:
+        # Same decoupled weight decay update as FusedAdam, done by a single
+        # fused kernel over all the params of a group.
+        optimizer = torch.optim.AdamW(param_groups,
+                                      lr=args.lr, weight_decay=args.weight_decay, fused=True)
     else:
         # Use FusedAdam.
         optimizer = Adam(param_groups,
@@ -191,13 +218,53 @@ def setup_model_and_optimizer(args):
             )
         else:
             optimizer = get_optimizer(param_groups, args)
+            if args.overlap_optim_with_ddp:
+                # Gradients are stepped bucket by bucket, so there are no
+                # master grads or global norm to clip.
+                assert USE_TORCH_DDP and args.fused_adamw and args.clip_grad <= 0 \
+                    and not args.fp16 and (not args.amp or args.bf16), \
+                    '--overlap-optim-with-ddp needs torch DDP, --fused-adamw, --clip-grad 0 and no fp16 loss scaling'
+                model.register_optimizer_hook(optimizer)
         lr_scheduler = get_learning_rate_scheduler(optimizer, args)
     else:
         optimizer, lr_scheduler = None, None
 
+    # Loss scaling of --amp, a no-op for bf16 and without --amp.
+    assert not (args.amp and args.fp16), '--amp replaces --fp16, use only one of them'
+    assert not args.amp or TORCH_VERSION >= (1, 10), '--amp needs torch>=1.10'
+    global grad_scaler
+    grad_scaler = torch.cuda.amp.GradScaler(enabled=args.amp and not args.bf16)
+
     return model, optimizer, lr_scheduler
 
 
+# Attention masks that only depend on the shapes, keyed by
+# (seq_length, mem_length, transformer_xl, dtype, device) and shared between steps.
+_ATTENTION_MASK_CACHE = {}
+
+
+def get_attention_mask(seq_length, mem_length, transformer_xl, dtype, device):
+    """Band mask equal to tril(triu(ones, 1 - seq_length + mem_length), mem_length)
+    for transformer_xl and to tril(ones) otherwise, built in the target dtype."""
+    key = (seq_length, mem_length, transformer_xl, dtype, device)
+    # Cached tensors are never built in inference mode, training can't use
+    # the inference tensors evaluate would otherwise leave here.
+    if key not in _ATTENTION_MASK_CACHE:
+        with inference_mode(False):
+            query_ids = torch.arange(seq_length, device=device).unsqueeze(1)
+            key_ids = torch.arange(seq_length + mem_length, device=device).unsqueeze(0)
+            distance = key_ids - query_ids
+            attention_mask = distance <= mem_length
+            if transformer_xl:
+                attention_mask &= distance >= 1 - seq_length + mem_length
+            _ATTENTION_MASK_CACHE[key] = attention_mask.to(dtype).view(1, 1, seq_length, seq_length + mem_length)
+    return _ATTENTION_MASK_CACHE[key]
+
+
+# torch.arange(seq_length) rows keyed by (seq_length, device), never written to.
+_POSITION_IDS_CACHE = {}
+
+
 def get_masks_and_position_ids(data,
                                eod_token,
                                reset_position_ids,
@@ -205,64 +272,90 @@ def get_masks_and_position_ids(data,
                                loss_mask=None,
                                attention_mask=None,
                                transformer_xl=False,
-                               mem_length=None):
+                               mem_length=None,
+                               dtype=torch.float,
+                               compact_mask=False):
     # Extract batch size and sequence length.
     batch_size, seq_length = data.size()
 
     # Attention mask (lower triangular).
-    if transformer_xl:
-        if attention_mask is None:
-            attention_mask = torch.ones((1, seq_length, seq_length + mem_length), device=data.device)
-        attention_mask = torch.tril(torch.triu(attention_mask, 1 - seq_length + mem_length), mem_length)
+    if attention_mask is None and compact_mask and not transformer_xl and not reset_attention_mask:
+        # The plain causal mask is rebuilt inside the model from the lengths.
+        attention_mask = None
+    elif attention_mask is None:
+        attention_mask = get_attention_mask(seq_length, mem_length if transformer_xl else 0,
+                                            transformer_xl, dtype, data.device)
     else:
-        if reset_attention_mask:
-            att_mask_batch = batch_size
+        if transformer_xl:
+            attention_mask = torch.tril(torch.triu(attention_mask, 1 - seq_length + mem_length), mem_length)
         else:
-            att_mask_batch = 1
-        if attention_mask is None:
-            attention_mask = torch.ones((att_mask_batch, seq_length, seq_length), device=data.device)
-        attention_mask = torch.tril(attention_mask)
-    attention_mask = attention_mask.unsqueeze(1)
+            attention_mask = torch.tril(attention_mask)
+        attention_mask = attention_mask.unsqueeze(1).to(dtype)
 
     # Loss mask.
-    if loss_mask is None:
+    if loss_mask is None and transformer_xl:
         loss_mask = torch.ones(data.size(), dtype=torch.float, device=data.device)
 
     # Position ids.
-    position_ids = torch.arange(seq_length, dtype=torch.long,
-                                device=data.device)
-    position_ids = position_ids.unsqueeze(0).expand_as(data)
+    key = (seq_length, data.device)
+    if key not in _POSITION_IDS_CACHE:
+        with inference_mode(False):
+            _POSITION_IDS_CACHE[key] = torch.arange(seq_length, dtype=torch.long,
+                                                    device=data.device).unsqueeze(0)
+    # Left as (1, seq_length), the position embedding broadcasts over the batch
+    # and only looks up one row of ids. A reset gives per-sample ids below.
+    position_ids = _POSITION_IDS_CACHE[key]
     if not transformer_xl:
-        loss_mask[data == eod_token] = 0.0
-        # We need to clone as the ids will be modifed based on batch index.
-        if reset_position_ids:
-            position_ids = position_ids.clone()
-
-        if reset_position_ids or reset_attention_mask:
-            # Loop through the batches:
-            for b in range(batch_size):
-
-                # Find indecies where EOD token is.
-                eod_index = position_ids[b, data[b] == eod_token]
-                # Detach indecies from positions if going to modify positions.
-                if reset_position_ids:
-                    eod_index = eod_index.clone()
-
-                # Loop through EOD indecies:
-                prev_index = 0
-                for j in range(eod_index.size()[0]):
-                    i = eod_index[j]
-                    # Mask attention loss.
-                    if reset_attention_mask:
-                        attention_mask[b, 0, (i+1):, :(i+1)] = 0
-                    # Reset positions.
-                    if reset_position_ids:
-                        position_ids[b, (i+1):] -= (i + 1 - prev_index)
-                        prev_index = i + 1
+        attention_mask, loss_mask, position_ids = reset_masks_at_eod(
+            data, eod_token, reset_position_ids, reset_attention_mask,
+            loss_mask, attention_mask, position_ids)
 
     return attention_mask, loss_mask, position_ids
 
 
+def document_masks(data, eod_token, reset_position_ids, reset_attention_mask,
+                   loss_mask, attention_mask, position_ids):
+    """Mask the loss at EOD tokens and optionally restart positions and attention
+    after them. Only tensor ops without python side effects, so main can swap
+    in a torch.compile'd version (--compile-masks)."""
+    batch_size = data.size(0)
+    is_eod = data == eod_token
+    # masked_fill_ instead of boolean indexing, which syncs with the device.
+    if loss_mask is None:
+        loss_mask = (~is_eod).float()
+    else:
+        loss_mask.masked_fill_(is_eod, 0.0)
+
+    # A new document starts right after each EOD token, the EOD token
+    # itself still belongs to the previous one.
+    if reset_position_ids:
+        position_ids = position_ids.expand_as(data)
+        doc_start = torch.where(is_eod, position_ids + 1, torch.zeros_like(position_ids))
+        doc_start = doc_start.cummax(dim=1).values
+        doc_start = torch.cat((doc_start.new_zeros(batch_size, 1), doc_start[:, :-1]), dim=1)
+        position_ids = position_ids - doc_start
+
+    if reset_attention_mask:
+        doc_ids = is_eod.long().cumsum(dim=1) - is_eod.long()
+        same_doc = doc_ids.unsqueeze(2) == doc_ids.unsqueeze(1)
+        attention_mask = attention_mask * same_doc.unsqueeze(1)
+
+    return attention_mask, loss_mask, position_ids
+
+
+reset_masks_at_eod = document_masks
+
+
+def get_compute_dtype(args):
+    """Dtype the attention scores are computed in, the cached attention mask
+    is built in it so adding the mask neither casts it nor upcasts the scores."""
+    if args.fp16 or (args.amp and not args.bf16):
+        return torch.half
+    if args.amp:
+        return torch.bfloat16
+    return torch.float
+
+
 def get_batch(data_iterator, args, timers):
     ''' get_batch subdivides the source data into chunks of
     length args.seq_length. If source is equal to the example
@@ -277,8 +370,14 @@ def get_batch(data_iterator, args, timers):
     shard reset mask of the same dimensions is also returned.
     '''
     # Items and their type.
-    keys = ['text', 'target', 'loss_mask', 'attention_mask'] if args.xl_dataset else ['text', 'loss_mask']
+    keys = ['text', 'target', 'loss_mask'] if args.xl_dataset else ['text', 'loss_mask']
     datatype = torch.int64
+    if args.xl_dataset:
+        # The 0/1 mask is sent as uint8 in the same broadcast and only cast
+        # once, to the compute dtype, in get_masks_and_position_ids.
+        keys.append('attention_mask')
+        datatype = {key: torch.int64 for key in keys}
+        datatype['attention_mask'] = torch.uint8
 
     # Broadcast data.
     timers('data loader').start()
@@ -292,7 +391,7 @@ def get_batch(data_iterator, args, timers):
     if args.xl_dataset:
         tokens = data_b['text'].long()
         labels = data_b['target'].long()
-        attention_mask = data_b['attention_mask'].float()
+        attention_mask = data_b['attention_mask']
         loss_mask = data_b['loss_mask'].float()
     else:
         tokens_ = data_b['text'].long()
@@ -311,15 +410,15 @@ def get_batch(data_iterator, args, timers):
         loss_mask=loss_mask,
         attention_mask=attention_mask,
         transformer_xl=args.xl_dataset,
-        mem_length=args.mem_length)
-    # Convert
-    if args.fp16:
-        attention_mask = attention_mask.half()
+        mem_length=args.mem_length,
+        dtype=get_compute_dtype(args),
+        compact_mask=args.compact_mask)
 
     return tokens, labels, loss_mask, attention_mask, position_ids
 
 
 tokenizer = None
+grad_scaler = None
 
 
 def forward_step(data_iterator, model, args, timers, mems):
@@ -338,11 +437,17 @@ def forward_step(data_iterator, model, args, timers, mems):
     # last_tokens = tokens[:, -1].tolist()
     timers('batch generator').stop()
     # Forward model.
-    logits, *mems = model(tokens, position_ids, attention_mask, *mems)
-    losses = mpu.vocab_parallel_cross_entropy(logits.contiguous().float(),
-                                              labels)
+    with ExitStack() as stack:
+        if args.amp:
+            # autocast only takes a dtype from torch 1.10 on, --amp needs it.
+            stack.enter_context(torch.cuda.amp.autocast(
+                dtype=torch.bfloat16 if args.bf16 else torch.float16))
+        logits, *mems = model(tokens, position_ids, attention_mask, *mems)
+    # The cross entropy upcasts the fp16 logits to fp32 itself.
+    losses = mpu.vocab_parallel_cross_entropy(logits, labels)
     loss_mask = loss_mask.view(-1)
-    loss = torch.sum(losses.view(-1) * loss_mask) / loss_mask.sum()
+    # dot does the masking multiply and the sum in one kernel.
+    loss = torch.dot(losses.view(-1), loss_mask) / loss_mask.sum()
 
     return loss, mems
 
@@ -357,12 +462,22 @@ def backward_step(optimizer, model, lm_loss, args, timers):
     if args.deepspeed:
         model.backward(loss)
     else:
-        optimizer.zero_grad()
+        # Set the grads to None instead of zeroing them, backward then writes
+        # them directly rather than accumulating into zeros.
+        if args.fp16:
+            optimizer.zero_grad(set_grads_to_None=True)
+        elif isinstance(optimizer, Adam) or TORCH_VERSION < (1, 7):
+            # apex FusedAdam takes no argument, it drops the grads by default.
+            # torch optimizers only have set_to_none from torch 1.7 on.
+            optimizer.zero_grad()
+        else:
+            optimizer.zero_grad(set_to_none=True)
         if args.fp16:
             optimizer.backward(loss, update_master_grads=False)
         else:
-            loss.backward()
+            grad_scaler.scale(loss).backward()
 
+    # The loss is all-reduced by train once per log interval, not every step.
     reduced_losses = lm_loss.view(1)
 
     if args.deepspeed:
@@ -370,8 +485,6 @@ def backward_step(optimizer, model, lm_loss, args, timers):
         # Reset the timer to avoid breaking timer logs below.
         timers('allreduce').reset()
     else:
-        torch.distributed.all_reduce(reduced_losses.data)
-        reduced_losses.data = reduced_losses.data / args.world_size
         if not USE_TORCH_DDP:
             timers('allreduce').start()
             model.allreduce_params(reduce_after=False,
@@ -388,6 +501,7 @@ def backward_step(optimizer, model, lm_loss, args, timers):
         # Clipping gradients helps prevent the exploding gradient.
         if args.clip_grad > 0:
             if not args.fp16:
+                grad_scaler.unscale_(optimizer)
                 mpu.clip_grad_norm(model.parameters(), args.clip_grad)
             else:
                 optimizer.clip_master_grads(args.clip_grad)
@@ -398,13 +512,13 @@ def backward_step(optimizer, model, lm_loss, args, timers):
 def see_memory_usage(message, force=False):
     if not force:
         return
-    dist.barrier()
+    # No barrier, rank 0 only reads its own allocator state.
     if dist.get_rank() == 0:
         print(message)
         print("Memory Allocated ", torch.cuda.memory_allocated()/(1024*1024*1024), "GigaBytes")
         print("Max Memory Allocated ", torch.cuda.max_memory_allocated()/(1024*1024*1024), "GigaBytes")
-        print("Cache Allocated ", torch.cuda.memory_cached()/(1024*1024*1024), "GigaBytes")
-        print("Max cache Allocated ", torch.cuda.max_memory_cached()/(1024*1024*1024), "GigaBytes")
+        print("Cache Allocated ", torch.cuda.memory_reserved()/(1024*1024*1024), "GigaBytes")
+        print("Max cache Allocated ", torch.cuda.max_memory_reserved()/(1024*1024*1024), "GigaBytes")
         print(" ")
         #input("Press Any Key To Continue ..")
 
@@ -412,7 +526,10 @@ def see_memory_usage(message, force=False):
 def train_step(data_iterator, model, optimizer, lr_scheduler,
                args, timers, mems):
     """Single training step."""
-    while True:
+    # DeepSpeed accumulates the gradients of several micro batches itself,
+    # model.step() only updates the parameters on the last one.
+    num_micro_batches = model.gradient_accumulation_steps() if args.deepspeed else 1
+    for _ in range(num_micro_batches):
         # Forward model for one step.
         timers('forward').start()
         lm_loss, mems = forward_step(data_iterator, model, args, timers, mems)
@@ -425,30 +542,32 @@ def train_step(data_iterator, model, optimizer, lr_scheduler,
         lm_loss_reduced = backward_step(optimizer, model, lm_loss, args, timers)
         timers('backward').stop()
 
-        # Update parameters.
-        skipped_iter, complete = 0, False
-        timers('optimizer').start()
         if args.deepspeed:
-            if model.is_gradient_accumulation_boundary():
-                model.step()
-                complete = True
-                if not (args.fp16 and optimizer.overflow):
-                    lr_scheduler.step()
-                else:
-                    skipped_iter = 1
-            else:
-                model.step()
+            timers('optimizer').start()
+            model.step()
+            timers('optimizer').stop()
+
+    # Update parameters.
+    skipped_iter = 0
+    timers('optimizer').start()
+    if args.deepspeed:
+        if not (args.fp16 and optimizer.overflow):
+            lr_scheduler.step()
         else:
-            optimizer.step()
-            complete = True
-            # Update learning rate.
-            if not (args.fp16 and optimizer.overflow):
-                lr_scheduler.step()
-            else:
-                skipped_iter = 1
-        timers('optimizer').stop()
-        if complete:
-            break
+            skipped_iter = 1
+    else:
+        if not args.overlap_optim_with_ddp:
+            grad_scaler.step(optimizer)
+        # The scaler skips the step and lowers the scale on an overflow.
+        # get_scale only syncs with --amp fp16, it is 1.0 otherwise.
+        scale = grad_scaler.get_scale()
+        grad_scaler.update()
+        # Update learning rate.
+        if not (args.fp16 and optimizer.overflow) and grad_scaler.get_scale() >= scale:
+            lr_scheduler.step()
+        else:
+            skipped_iter = 1
+    timers('optimizer').stop()
     return lm_loss_reduced, skipped_iter, mems
 
 
@@ -460,6 +579,8 @@ def report_iteration_metrics(summary_writer, optimizer, lr, loss, elapsed_time,
     if args.fp16:
         log_string += ' loss scale {:.1f} |'.format(
             optimizer.cur_scale if args.deepspeed else optimizer.loss_scale)
+    elif grad_scaler.is_enabled():
+        log_string += ' loss scale {:.1f} |'.format(grad_scaler.get_scale())
     print_rank_0(log_string)
     if summary_writer is not None:
         summary_writer.add_scalar(f'Train/lr', lr, step)
@@ -488,8 +609,8 @@ def train(model, optimizer, lr_scheduler,
     # Turn on training mode which enables dropout.
     model.train()
 
-    # Tracking loss.
-    total_lm_loss = 0.0
+    # Tracking loss, accumulated on the device and only read when logging.
+    total_lm_loss = torch.zeros(1, device=torch.cuda.current_device())
 
     # Iterations.
     skipped_iters = 0
@@ -508,17 +629,22 @@ def train(model, optimizer, lr_scheduler,
         args.iteration += 1
 
         # Update losses.
-        total_lm_loss += lm_loss.data.detach().float()
+        total_lm_loss.add_(lm_loss.detach())
 
         # Logging.
         if args.iteration % args.log_interval == 0:
             learning_rate = optimizer.param_groups[0]['lr']
+            if not args.deepspeed:
+                # One all-reduce for the losses of the whole interval.
+                torch.distributed.all_reduce(total_lm_loss)
+                total_lm_loss /= args.world_size
             avg_lm_loss = total_lm_loss.item() / args.log_interval
+            total_lm_loss.zero_()
             elapsed_time = timers('interval time').elapsed()
             report_iteration_metrics(summary_writer, optimizer, learning_rate, avg_lm_loss,
                                      elapsed_time * 1000.0 / args.log_interval, args.iteration, args.train_iters, args)
-            total_lm_loss = 0.0
-            if report_memory_flag:
+            if report_memory_flag or (args.report_memory_interval and
+                                      args.iteration % args.report_memory_interval == 0):
                 report_memory('after {} iterations'.format(args.iteration))
                 report_memory_flag = False
             if USE_TORCH_DDP:
@@ -531,7 +657,8 @@ def train(model, optimizer, lr_scheduler,
                            normalizer=args.log_interval)
         # Checkpointing
         if args.save and args.save_interval and args.iteration % args.save_interval == 0:
-            save_checkpoint(args.iteration, model, optimizer, lr_scheduler, args)
+            save_checkpoint(args.iteration, model, optimizer, lr_scheduler, args,
+                            grad_scaler=grad_scaler)
 
         # Evaluation
         if args.eval_interval and args.iteration % args.eval_interval == 0 and args.do_valid:
@@ -558,7 +685,8 @@ def evaluate(data_iterator, model, args, timers, verbose=False):
 
     total_lm_loss = 0
     mems = []
-    with torch.no_grad():
+    # Nothing computed here is used by autograd later, the loss leaves as a float.
+    with inference_mode():
         iteration = 0
         while iteration < args.eval_iters:
             iteration += 1
@@ -697,13 +825,23 @@ def get_train_val_test_data(args):
 def main():
     """Main training program."""
 
-    # Disable CuDNN.
-    torch.backends.cudnn.enabled = False
     # Timer.
     timers = Timers()
 
     # Arguments.
     args = get_args()
+
+    # Enable CuDNN, and TF32 matmuls on GPUs that support them (Ampere and newer).
+    torch.backends.cudnn.enabled = True
+    torch.backends.cudnn.benchmark = True
+    if not args.disable_tf32 and torch.cuda.get_device_capability()[0] >= 8:
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+    if args.compile_masks:
+        # The reset flags and the shapes are fixed for the whole run, so the
+        # compiled graph is specialized once and fuses the mask ops.
+        global reset_masks_at_eod
+        reset_masks_at_eod = torch.compile(document_masks, dynamic=False, fullgraph=True)
     args.mem_length = args.mem_length if args.transformer_xl else 0
     if args.load and not args.finetune:
         args.experiment_name = os.path.basename(os.path.normpath(args.load))
@@ -726,7 +864,8 @@ def main():
 
     if args.load is not None:
         with FileLock(os.path.join(pathlib.Path.home(), "checkpoint_lock"), timeout=-1):
-            args.iteration = load_checkpoint(model, optimizer, lr_scheduler, args)
+            args.iteration = load_checkpoint(model, optimizer, lr_scheduler, args,
+                                             grad_scaler=grad_scaler)
     else:
         args.iteration = 0
     torch.distributed.barrier()
@@ -748,7 +887,7 @@ def main():
             val_data.batch_sampler.start_iter = start_iter_val % \
                                                 len(val_data)
     if train_data is not None:
-        train_data_iterator = iter(train_data)
+        train_data_iterator = CUDAPrefetcher(iter(train_data))
     else:
         train_data_iterator = None
     if val_data is not None:
@@ -762,7 +901,8 @@ def main():
         if args.do_train:
             with ExitStack() as stack:
                 def save_on_exit(args_, model_, optimizer_, lr_scheduler_):
-                    save_checkpoint(args_.iteration, model_, optimizer_, lr_scheduler_, args_)
+                    save_checkpoint(args_.iteration, model_, optimizer_, lr_scheduler_, args_,
+                                    grad_scaler=grad_scaler)
                 # stack.callback(save_on_exit, args, model, optimizer, lr_scheduler)
                 iteration, skipped = train(model, optimizer,
                                            lr_scheduler,
@@ -776,7 +916,7 @@ def main():
                                                   model, args, timers, False)
 
     if args.save and iteration != 0:
-        save_checkpoint(iteration, model, optimizer, lr_scheduler, args)
+        save_checkpoint(iteration, model, optimizer, lr_scheduler, args, grad_scaler=grad_scaler)
 
     if test_data is not None:
         test_data_iterator = iter(test_data)
@@ -143,16 +143,56 @@ class Timers:
 def report_memory(name):
     """Simple GPU memory report."""
 
+    # Only rank 0 prints, the others need not query their allocator.
+    if torch.distributed.is_initialized() and torch.distributed.get_rank() != 0:
+        return
     mega_bytes = 1024.0 * 1024.0
     string = name + ' memory (MB)'
     string += ' | allocated: {}'.format(
         torch.cuda.memory_allocated() / mega_bytes)
     string += ' | max allocated: {}'.format(
         torch.cuda.max_memory_allocated() / mega_bytes)
-    string += ' | cached: {}'.format(torch.cuda.memory_cached() / mega_bytes)
-    string += ' | max cached: {}'.format(
-        torch.cuda.memory_reserved() / mega_bytes)
-    print_rank_0(string)
+    string += ' | reserved: {}'.format(torch.cuda.memory_reserved() / mega_bytes)
+    string += ' | max reserved: {}'.format(
+        torch.cuda.max_memory_reserved() / mega_bytes)
+    print(string, flush=True)
+
+
+class CUDAPrefetcher:
+    """Wrap a data iterator of tensor dicts so that the next batch is already
+    copied to the GPU on a side stream while the current one is in use."""
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.stream = torch.cuda.Stream()
+        self.preload()
+
+    def preload(self):
+        try:
+            batch = next(self.iterator)
+        except StopIteration:
+            self.batch = None
+            return
+        # The loaders pin their memory, so these copies are asynchronous.
+        with torch.cuda.stream(self.stream):
+            self.batch = {key: value.cuda(non_blocking=True) if torch.is_tensor(value) else value
+                          for key, value in batch.items()}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        current_stream = torch.cuda.current_stream()
+        current_stream.wait_stream(self.stream)
+        batch = self.batch
+        if batch is None:
+            raise StopIteration
+        # Tell the allocator the tensors are now used on the compute stream.
+        for value in batch.values():
+            if torch.is_tensor(value):
+                value.record_stream(current_stream)
+        self.preload()
+        return batch
 
 
 def get_checkpoint_name(checkpoints_path, iteration, release=False, zero=False):
@@ -186,7 +226,7 @@ def save_zero_checkpoint(args, iteration, optimizer):
 
 
 def save_checkpoint(iteration, model, optimizer,
-                    lr_scheduler, args):
+                    lr_scheduler, args, grad_scaler=None):
     """Save a model checkpoint."""
     if args.deepspeed:
         save_ds_checkpoint(iteration, model, lr_scheduler, args)
@@ -210,6 +250,8 @@ def save_checkpoint(iteration, model, optimizer,
                     sd['optimizer'] = optimizer.state_dict()
                 if lr_scheduler is not None:
                     sd['lr_scheduler'] = lr_scheduler.state_dict()
+                if grad_scaler is not None and grad_scaler.is_enabled():
+                    sd['grad_scaler'] = grad_scaler.state_dict()
 
             # rng states.
             if not args.no_save_rng:
@@ -285,7 +327,8 @@ def get_checkpoint_iteration(args):
     return args.load, iteration, release, True
 
 
-def load_checkpoint(model, optimizer, lr_scheduler, args, load_optimizer_states=True):
+def load_checkpoint(model, optimizer, lr_scheduler, args, load_optimizer_states=True,
+                    grad_scaler=None):
     """Load a model checkpoint."""
 
     load_dir, iteration, release, success = get_checkpoint_iteration(args)
@@ -336,6 +379,10 @@ def load_checkpoint(model, optimizer, lr_scheduler, args, load_optimizer_states=
                     optimizer.load_state_dict(sd['optimizer'])
                 if not args.no_load_lr_scheduler and lr_scheduler is not None:
                     lr_scheduler.load_state_dict(sd['lr_scheduler'])
+                # Older checkpoints and runs without --amp have no scaler state.
+                if not args.no_load_optim and grad_scaler is not None and grad_scaler.is_enabled() \
+                        and 'grad_scaler' in sd:
+                    grad_scaler.load_state_dict(sd['grad_scaler'])
             except KeyError:
                 print_rank_0('Unable to load optimizer from checkpoint {}, exiting. '
                              'Specify --no-load-optim or --finetune to prevent '